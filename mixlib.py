@@ -0,0 +1,412 @@
+import os
+import subprocess
+import argparse
+import json
+import shutil
+import tempfile
+import wave
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import accumulate
+
+Track = namedtuple('Track', ['path', 'name'])
+
+# Format surowego audio przesyłanego między procesami ffmpeg
+PCM_FORMAT = ["-f", "s16le", "-ar", "44100", "-ac", "2"]
+PIPE_BLOCK_SIZE = 1024 * 1024
+
+# Domyślnie ffmpeg wypisuje tylko błędy, bez banera i linii postępu (wyłącza to --verbose)
+QUIET_ARGS = ["-hide_banner", "-loglevel", "error", "-nostats"]
+
+# Znaki specjalne na kolejnych poziomach parsowania tekstu przez ffmpeg
+DRAWTEXT_SPECIAL = "\\%"
+OPTION_SPECIAL = "\\':"
+GRAPH_SPECIAL = "\\'[],;"
+
+# Styl napisów oraz linia pliku sendcmd zmieniająca tytuł na początku utworu
+TEXT_STYLE_FMT = "fontsize={size}:fontcolor={color}:box=1:boxcolor=black@0.5:boxborderw=5"
+TITLE_COMMAND_FMT = "{start_time} drawtext@title reinit {text};"
+
+# Domyślny preset dla każdego obsługiwanego kodera H.264 (h264_vaapi nie ma presetów)
+VIDEO_ENCODERS = {
+    "libx264": "medium",
+    "h264_nvenc": "p4",
+    "h264_qsv": "medium",
+    "h264_vaapi": None,
+}
+
+def get_track_name(line):
+    # Bajty spoza UTF-8 zamieniamy w tytule na znak zastępczy, bo skrypty filtrów zapisujemy jako UTF-8
+    name = os.path.splitext(os.path.basename(line))[0]
+    return name.encode('utf-8', 'surrogateescape').decode('utf-8', 'replace')
+
+def read_m3u_playlist(playlist_path):
+    base_dir = os.path.dirname(playlist_path)
+    # surrogateescape zachowuje bajty nazw spoza UTF-8 (np. cp1250), więc ścieżki dalej wskazują istniejące pliki
+    with open(playlist_path, 'r', encoding='utf-8', errors='surrogateescape') as file:
+        lines = file.read().splitlines()
+    return [
+        Track(os.path.join(base_dir, line), get_track_name(line))
+        for raw_line in lines
+        if (line := raw_line.strip()) and not line.startswith('#')
+    ]
+
+def escape_special(text, special):
+    return "".join(f"\\{c}" if c in special else c for c in text)
+
+def escape_drawtext(text):
+    # Trzy poziomy escapowania, od najbardziej wewnętrznego: rozwijanie tekstu w drawtext,
+    # parser opcji filtra i parser grafu filtrów. Nazwa utworu trafia do ffmpeg bez powłoki,
+    # więc nie potrzebuje już cudzysłowów.
+    for special in (DRAWTEXT_SPECIAL, OPTION_SPECIAL, GRAPH_SPECIAL):
+        text = escape_special(text, special)
+    return text
+
+def escape_filter_path(path):
+    return escape_special(escape_special(path, OPTION_SPECIAL), GRAPH_SPECIAL)
+
+def escape_sendcmd_text(text):
+    # Argument "reinit" dla sendcmd: tekst drawtext jak wyżej, ale zamiast poziomu grafu
+    # całość idzie w apostrofach, które rozumie parser pliku sendcmd
+    option = "text=" + escape_special(escape_special(text, DRAWTEXT_SPECIAL), OPTION_SPECIAL)
+    return "'" + option.replace("'", "'\\''") + "'"
+
+def build_crossfade_filter(inputs, crossfade_duration, output):
+    # Łączymy sąsiednie pary poziomami (drzewo zrównoważone), więc głębokość grafu to log N
+    # zamiast N i niezależne gałęzie mogą być przetwarzane równolegle. Kolejność i czas
+    # przejść są takie same jak w łańcuchu.
+    filter_complex_parts = []
+    level = list(inputs)
+    node = 0
+
+    while len(level) > 1:
+        next_level = []
+        for i in range(0, len(level) - 1, 2):
+            node += 1
+            current_output = output if len(level) == 2 else f"[a{node}]"
+            filter_complex_parts.append(
+                f"{level[i]}{level[i + 1]}acrossfade=d={crossfade_duration}:c1=tri:c2=tri{current_output}"
+            )
+            next_level.append(current_output)
+        if len(level) % 2:
+            next_level.append(level[-1])
+        level = next_level
+
+    return ";".join(filter_complex_parts)
+
+def write_filter_script(filter_complex, directory=None):
+    # Graf rośnie z liczbą utworów, więc przekazujemy go plikiem zamiast argumentem (limit ARG_MAX)
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', encoding='utf-8', dir=directory, delete=False) as script:
+        script.write(filter_complex)
+    return script.name
+
+def split_into_shards(tracks, shard_count):
+    bounds = [round(i * len(tracks) / shard_count) for i in range(shard_count + 1)]
+    return [tracks[bounds[i]:bounds[i + 1]] for i in range(shard_count)]
+
+def build_mix_cmd(chunk, next_track, trim_start, crossfade_duration, output, script_dir, global_args=()):
+    # Granice między shardami: ten shard kończy się przejściem w pierwsze crossfade_duration
+    # sekund następnego utworu, a kolejny shard zaczyna ten utwór od tego miejsca.
+    # Po sklejeniu shardów dostajemy ten sam mix co z jednego grafu.
+    command = ["ffmpeg", *global_args, "-nostdin"]
+    for track in chunk:
+        command += ["-i", track.path]
+    inputs = [f"[{i}:a]" for i in range(len(chunk))]
+    filter_complex_parts = []
+
+    if trim_start:
+        filter_complex_parts.append(f"[0:a]atrim=start={crossfade_duration},asetpts=PTS-STARTPTS[first]")
+        inputs[0] = "[first]"
+    if next_track is not None:
+        command += ["-i", next_track.path]
+        filter_complex_parts.append(f"[{len(chunk)}:a]atrim=end={crossfade_duration}[next]")
+        inputs.append("[next]")
+    filter_complex_parts.append(build_crossfade_filter(inputs, crossfade_duration, "[mix]"))
+
+    command += [
+        "-filter_complex_script", write_filter_script(";".join(filter_complex_parts), script_dir),
+        "-map", "[mix]",
+        *PCM_FORMAT,
+        output,
+        "-y"
+    ]
+    return command
+
+def decode_track(track, output_file, global_args=()):
+    command = ["ffmpeg", *global_args, "-nostdin", "-i", track.path, "-c:a", "pcm_s16le", "-f", "wav", output_file, "-y"]
+    subprocess.run(command, check=True)
+    return track._replace(path=output_file)
+
+def get_wav_duration(wav_path):
+    # Długość liczona z liczby próbek zdekodowanego pliku, bez paddingu kodera MP3,
+    # więc zgadza się co do próbki z tym, co faktycznie trafia do mixu
+    with wave.open(wav_path, 'rb') as wav:
+        return wav.getnframes() / wav.getframerate()
+
+def decode_tracks(tracks, decode_dir, global_args=()):
+    # Dekodowanie MP3 rozkładamy na wszystkie rdzenie; shardy miksują potem gotowe WAV-y
+    output_files = [os.path.join(decode_dir, f"track_{i:04d}.wav") for i in range(len(tracks))]
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+        return list(executor.map(lambda track, output_file: decode_track(track, output_file, global_args), tracks, output_files))
+
+def stream_mix(tracks, crossfade_duration, shard_count, shard_dir, sink, global_args=()):
+    chunks = split_into_shards(tracks, shard_count)
+    commands = []
+    shard_files = []
+    for i, chunk in enumerate(chunks):
+        next_track = chunks[i + 1][0] if i + 1 < len(chunks) else None
+        output = "pipe:1" if i == 0 else os.path.join(shard_dir, f"shard_{i:03d}.pcm")
+        commands.append(build_mix_cmd(chunk, next_track, i > 0, crossfade_duration, output, shard_dir, global_args))
+        shard_files.append(output)
+
+    # Pierwszy shard płynie prosto do potoku, pozostałe liczą się w tle do plików
+    # i są dopisywane po kolei, więc kodowanie wideo startuje od razu
+    processes = []
+    try:
+        processes.append(subprocess.Popen(commands[0], stdout=subprocess.PIPE))
+        processes += [subprocess.Popen(command) for command in commands[1:]]
+
+        # Błąd któregokolwiek shardu przerywa strumień od razu, a nie dopiero po zmiksowaniu całości
+        for block in iter(lambda: processes[0].stdout.read1(PIPE_BLOCK_SIZE), b""):
+            raise_if_failed(processes, commands)
+            sink.write(block)
+        processes[0].stdout.close()
+
+        for process, command, shard_file in zip(processes, commands, shard_files):
+            if process.wait() != 0:
+                raise subprocess.CalledProcessError(process.returncode, command)
+            if shard_file != "pipe:1":
+                raise_if_failed(processes, commands)
+                with open(shard_file, 'rb') as file:
+                    shutil.copyfileobj(file, sink)
+    except BaseException:
+        # Np. BrokenPipeError, gdy koder wideo padł - nie czekamy, aż pozostałe shardy skończą mix
+        for process in processes:
+            process.kill()
+        raise
+    finally:
+        for process in processes:
+            if process.stdout:
+                process.stdout.close()
+            process.wait()
+
+def raise_if_failed(processes, commands):
+    for process, command in zip(processes, commands):
+        if process.poll() not in (None, 0):
+            raise subprocess.CalledProcessError(process.returncode, command)
+
+def get_available_encoders():
+    result = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    return {parts[1] for parts in map(str.split, result.stdout.splitlines()) if len(parts) > 1}
+
+def resolve_video_encoder(video_encoder, video_preset=None):
+    if video_encoder != "libx264" and video_encoder not in get_available_encoders():
+        print(f"Koder {video_encoder} nie jest dostępny w tej wersji ffmpeg, używam libx264.")
+        # Presety koderów sprzętowych (np. p5 dla NVENC) nie istnieją w libx264
+        if video_preset:
+            print(f"Pomijam preset {video_preset}, używam domyślnego presetu libx264.")
+        return "libx264", None
+    return video_encoder, video_preset
+
+def build_video_encoder_args(video_encoder, video_preset=None):
+    args = ["-c:v", video_encoder]
+    preset = video_preset or VIDEO_ENCODERS[video_encoder]
+    if preset:
+        args += ["-preset", preset]
+    if video_encoder == "h264_nvenc":
+        args += ["-tune", "ll", "-rc", "vbr"]
+    return args
+
+def build_waveform_cmd(background_png, output_video, filter_script, fps=15, video_encoder='libx264', video_preset=None, global_args=(), thread_args=()):
+    # VAAPI wymaga otwarcia urządzenia, do którego graf przesyła klatki (hwupload)
+    hw_device = ["-vaapi_device", "/dev/dri/renderD128"] if video_encoder == "h264_vaapi" else []
+    return [
+        "ffmpeg",
+        *global_args,
+        *hw_device,
+        "-framerate", str(fps),
+        "-loop", "1",
+        "-i", background_png,
+        *PCM_FORMAT, "-i", "pipe:0",
+        "-filter_complex_script", filter_script,
+        "-map", "[v]",
+        "-map", "[mix2]",
+        *build_video_encoder_args(video_encoder, video_preset),
+        *thread_args,
+        "-r", str(fps),
+        "-c:a", "libmp3lame",
+        "-shortest",
+        output_video,
+        "-y"
+    ]
+
+def get_image_size(image_path):
+    cmd = ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_streams', image_path]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        stream = json.loads(result.stdout)['streams'][0]
+        return stream['width'], stream['height']
+    except (ValueError, KeyError, IndexError):
+        return None
+
+def render_mix_video(tracks, output_video, background_png, crossfade_duration, visualization_type, wave_color, wave_opacity, text_color='orange', text_size=24, shard_count=1, video_encoder='libx264', video_preset=None, verbose=False, ff_threads=None, ff_filter_threads=None, fps=15, size=1000):
+    # VAAPI koduje z pamięci GPU, więc gotowe klatki trzeba tam jeszcze przesłać
+    hw_upload = ",format=nv12,hwupload" if video_encoder == "h264_vaapi" else ""
+
+    # Tło w docelowym rozmiarze trafia do overlay bez filtra scale, który działałby na każdej klatce
+    if get_image_size(background_png) == (size, size):
+        background, background_filter = "[0:v]", ""
+    else:
+        background, background_filter = "[bg]", f"[0:v]scale={size}:{size}[bg];"
+
+    global_args = [] if verbose else list(QUIET_ARGS)
+    if ff_filter_threads:
+        # Domyślnie ffmpeg przetwarza grafy filtrów w jednym wątku
+        global_args += ["-filter_threads", str(ff_filter_threads), "-filter_complex_threads", str(ff_filter_threads)]
+    thread_args = ["-threads", str(ff_threads)] if ff_threads else []
+
+    # Wszystkie pliki pośrednie (WAV-y, shardy, skrypty filtrów) żyją w katalogu tymczasowym,
+    # który znika po wyjściu z bloku, także przy błędzie. Tworzymy go obok pliku wyjściowego,
+    # bo zajmuje ok. 1,2 GB na godzinę audio, a /tmp bywa w RAM (tmpfs)
+    output_dir = os.path.dirname(os.path.abspath(output_video))
+    with tempfile.TemporaryDirectory(prefix=".mix_", dir=output_dir) as work_dir:
+        decoded_tracks = decode_tracks(tracks, work_dir, global_args)
+        durations = [get_wav_duration(track.path) for track in decoded_tracks]
+        # Każde przejście nakłada sąsiednie utwory na crossfade_duration sekund,
+        # więc utwór i zaczyna się i przejść wcześniej niż suma poprzednich długości
+        start_times = [
+            start_time - i * crossfade_duration
+            for i, start_time in enumerate([0, *accumulate(durations[:-1])])
+        ]
+
+        # Jeden węzeł drawtext na tytuły zamiast osobnego dla każdego utworu;
+        # sendcmd podmienia jego tekst na początku kolejnych utworów
+        title_commands = "\n".join([
+            TITLE_COMMAND_FMT.format(start_time=start_time, text=escape_sendcmd_text(track.name))
+            for track, start_time in zip(tracks[1:], start_times[1:])
+        ])
+        title_commands_path = write_filter_script(title_commands, work_dir)
+        text_style = TEXT_STYLE_FMT.format(size=text_size, color=text_color)
+        text_filter_string = (
+            f"sendcmd=f={escape_filter_path(title_commands_path)},"
+            f"drawtext@title={text_style}:"
+            f"x=10:y=h-th-10:text={escape_drawtext(tracks[0].name)},"
+            f"drawtext={text_style}:"
+            "x=w-tw-10:y=h-th-10:text='%{pts\\:hms}'"
+        )
+
+        # Wejście 0 to tło, wejście 1 to surowy PCM mixu podawany przez stdin. Tło jest
+        # statyczne, więc tło, fala i napisy liczą się tylko z --fps klatek na sekundę
+        filter_complex = (
+            f"{background_filter}"
+            f"[1:a]asplit=2[mix1][mix2];"
+            f"[mix1]showwaves=s={size}x{size}:r={fps}:mode={visualization_type}:colors={wave_color}@{wave_opacity}[waves];"
+            f"{background}[waves]overlay=format=auto:shortest=1,format=yuv420p,{text_filter_string}{hw_upload}[v]"
+        )
+
+        command = build_waveform_cmd(background_png, output_video, write_filter_script(filter_complex, work_dir), fps,
+                                     video_encoder, video_preset, global_args, thread_args)
+
+        process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        try:
+            stream_mix(decoded_tracks, crossfade_duration, shard_count, work_dir, process.stdin, global_args)
+        except BrokenPipeError:
+            # ffmpeg z wideo zakończył się przed końcem mixu - jego kod wyjścia sprawdzamy niżej
+            pass
+        except BaseException:
+            process.kill()
+            raise
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+            process.wait()
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, command)
+
+def even_size(value):
+    # Kodery H.264 w yuv420p wymagają parzystych wymiarów klatki
+    size = int(value)
+    if size <= 0 or size % 2:
+        raise argparse.ArgumentTypeError(f"rozmiar musi być dodatnią liczbą parzystą, podano {value}")
+    return size
+
+def positive_int(value):
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"wartość musi być dodatnią liczbą całkowitą, podano {value}")
+    return number
+
+def add_common_arguments(parser):
+    parser.add_argument("input_dir", type=str, help="Ścieżka do katalogu z plikami MP3 i playlistą M3U.")
+    parser.add_argument("output_file", type=str, help="Nazwa pliku wyjściowego MP4 z efektem crossfade, tłem PNG i waveformą.")
+    parser.add_argument("--crossfade_duration", type=int, default=5, help="Czas trwania crossfade w sekundach. Domyślnie 5 sekund.")
+    parser.add_argument("--background_png", type=str, required=True, help="Ścieżka do pliku PNG używanego jako tło.")
+    parser.add_argument("--visualization_type", type=str, default="line", choices=["line", "p2p", "cline"], 
+                        help="Typ wizualizacji fali dźwiękowej. Opcje: line (linia), p2p (punkt do punktu), cline (kolorowa linia). Domyślnie: line.")
+    parser.add_argument("--wave_color", type=str, default="white", help="Kolor fali dźwiękowej. Można użyć nazw kolorów (np. 'red', 'blue') lub kodów hex (np. '0xFFFFFF'). Domyślnie: white.")
+    parser.add_argument("--wave_opacity", type=float, default=1.0, help="Przezroczystość fali dźwiękowej. Wartość od 0.0 (pełna przezroczystość) do 1.0 (brak przezroczystości). Domyślnie: 1.0.")
+    parser.add_argument("--video_encoder", type=str, default="libx264", choices=list(VIDEO_ENCODERS),
+                        help="Koder wideo H.264. Sprzętowe: h264_nvenc (NVIDIA), h264_qsv (Intel), h264_vaapi (Linux VAAPI). Gdy koder nie jest dostępny, używany jest libx264. Domyślnie: libx264.")
+    parser.add_argument("--video_preset", type=str, default=None, help="Preset kodera wideo. Domyślnie: medium dla libx264 i h264_qsv, p4 dla h264_nvenc.")
+    parser.add_argument("--ff_threads", type=int, default=os.cpu_count() or 1, help="Liczba wątków kodera wideo (-threads). Domyślnie: liczba rdzeni.")
+    parser.add_argument("--ff_filter_threads", type=int, default=max(2, (os.cpu_count() or 1) // 2),
+                        help="Liczba wątków grafów filtrów (-filter_threads, -filter_complex_threads). Domyślnie: połowa rdzeni, co najmniej 2.")
+    parser.add_argument("--fps", type=positive_int, default=15, help="Liczba klatek na sekundę wideo. Tło jest statyczne, więc niższa wartość przyspiesza kodowanie. Domyślnie: 15.")
+    parser.add_argument("--size", type=even_size, default=1000, help="Bok kwadratowego wideo w pikselach (liczba parzysta), np. 720 dla szybszych wersji roboczych. Domyślnie: 1000.")
+    parser.add_argument("--verbose", action="store_true", help="Pokazuj pełne logi i postęp ffmpeg.")
+
+def run_pipeline(args):
+    input_dir = args.input_dir
+    output_file = args.output_file
+    if not output_file.lower().endswith('.mp4'):
+        output_file += '.mp4'
+    crossfade_duration = args.crossfade_duration
+    background_png = args.background_png
+    visualization_type = args.visualization_type
+    wave_color = args.wave_color
+    wave_opacity = args.wave_opacity
+    verbose = args.verbose
+    ff_threads = args.ff_threads
+    ff_filter_threads = args.ff_filter_threads
+    fps = args.fps
+    size = args.size
+    text_color = args.text_color
+    text_size = args.text_size
+
+    # Znajdź plik M3U w katalogu wejściowym
+    with os.scandir(input_dir) as entries:
+        playlist_path = next((entry.path for entry in entries if entry.name.endswith('.m3u') and entry.is_file()), None)
+    if playlist_path is None:
+        print("Nie znaleziono pliku M3U w katalogu wejściowym.")
+        return
+
+    tracks = read_m3u_playlist(playlist_path)
+
+    if len(tracks) < 2:
+        print("Potrzebujesz przynajmniej dwóch plików mp3 w playliście, aby utworzyć mix.")
+        return
+
+    # Długie playlisty miksujemy równolegle w kilku shardach (co najmniej 4 utwory na shard)
+    shard_count = min(os.cpu_count() or 1, max(1, len(tracks) // 4))
+
+    try:
+        # Sprawdzenie koderów uruchamia ffmpeg, więc jego brak trafia do obsługi błędów poniżej
+        video_encoder, video_preset = resolve_video_encoder(args.video_encoder, args.video_preset)
+
+        # Mix płynie potokiem PCM prosto do ffmpeg, który renderuje waveformę i koduje wynik
+        print("Generowanie mixu audio i waveformy z napisami...")
+        render_mix_video(tracks, output_file, background_png, crossfade_duration, visualization_type, wave_color, wave_opacity, text_color=text_color, text_size=text_size,
+                         shard_count=shard_count, video_encoder=video_encoder, video_preset=video_preset, verbose=verbose,
+                         ff_threads=ff_threads, ff_filter_threads=ff_filter_threads, fps=fps, size=size)
+
+        print(f"Waveforma z napisami została wygenerowana pomyślnie. Plik wyjściowy: {output_file}")
+
+    except subprocess.CalledProcessError as e:
+        print(f"Wystąpił błąd podczas przetwarzania: {e}")
+        print(f"Komenda, która spowodowała błąd: {e.cmd}")
+        print(f"Kod wyjścia: {e.returncode}")
+        print(f"Wyjście: {e.output}")
+    except Exception as e:
+        print(f"Wystąpił nieoczekiwany błąd: {e}")